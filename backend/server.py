@@ -1,26 +1,43 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+import asyncio
+import cachetools
+import hashlib
 import os
 import logging
+import random
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone
-from openai import OpenAI
+from openai import AsyncOpenAI
+import re
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; keep a floor of warm connections so the first requests
+# after startup don't pay connection-establishment latency
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=50,
+    minPoolSize=10,
+    serverSelectionTimeoutMS=5000,
+    compressors="zstd,zlib",
+    zlibCompressionLevel=3
+)
 db = client[os.environ['DB_NAME']]
 
-# Create the main app without a prefix
-app = FastAPI()
+# Create the main app without a prefix; orjson encodes responses
+# (including datetimes and large lists) much faster than stdlib json
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,9 +49,15 @@ CRISIS_KEYWORDS = [
     "ending it all", "take my own life", "not worth living"
 ]
 
+# Compile the keywords into one alternation so every message is scanned in a
+# single pass inside the C regex engine instead of one search per keyword;
+# IGNORECASE folds case during the scan, avoiding a lowercased copy of the
+# whole message on every call
+_crisis_pattern = re.compile("|".join(map(re.escape, CRISIS_KEYWORDS)), re.IGNORECASE)
+
 # Define Models
 class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     session_id: str
     message: str
     response: str
@@ -52,7 +75,7 @@ class ChatResponse(BaseModel):
     timestamp: datetime
 
 class ForumPost(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     channel: str
     title: str
     content: str
@@ -67,7 +90,7 @@ class ForumPostCreate(BaseModel):
     author: Optional[str] = None
 
 class ForumReply(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     content: str
     author: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -77,30 +100,196 @@ class ForumReplyCreate(BaseModel):
     author: Optional[str] = None
 
 class CrisisAlert(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     session_id: str
     message: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     status: str = "open"
 
+# List adapters validate a whole result set in one pydantic-core call instead
+# of running the model constructor per document
+_forum_post_list_adapter = TypeAdapter(List[ForumPost])
+_crisis_alert_list_adapter = TypeAdapter(List[CrisisAlert])
+
+# Shared OpenRouter client, created lazily on first use. The client is
+# session-independent (no per-session history is threaded through it), so one
+# instance can serve every request instead of rebuilding the HTTP client and
+# re-reading config on each call.
+_openai_client: Optional[AsyncOpenAI] = None
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the shared OpenRouter client, creating it on first use"""
+    global _openai_client
+    if _openai_client is None:
+        openrouter_key = os.environ.get('OPENROUTER_API_KEY')
+        if not openrouter_key:
+            raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
+        _openai_client = AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=openrouter_key,
+            default_headers={"HTTP-Referer": "http://localhost:3000"}
+        )
+    return _openai_client
+
+# Mental health system message
+SYSTEM_MESSAGE = """You are a compassionate mental health support assistant for students.
+Provide empathetic, supportive responses while maintaining appropriate boundaries.
+Encourage professional help when needed. Be warm, understanding, and non-judgmental.
+Keep responses concise but meaningful."""
+
+# Concurrent chat requests are coalesced: the endpoint queues its prompt and
+# awaits a future, and a single worker drains the queue every batch window and
+# dispatches the whole batch over the shared HTTP client in one gather
+LLM_BATCH_WINDOW_MS = int(os.environ.get('LLM_BATCH_WINDOW_MS', '100'))
+
+_llm_queue: asyncio.Queue = asyncio.Queue()
+
+async def _complete_message(message: str) -> str:
+    """Run a single chat completion against OpenRouter"""
+    client = get_openai_client()
+    response = await client.chat.completions.create(
+        model="openai/gpt-4o",  # You can change this to any model available on OpenRouter
+        messages=[
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": message}
+        ],
+        max_tokens=500,
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+async def _dispatch_batch(batch):
+    """Run one drained batch concurrently and resolve its futures"""
+    results = await asyncio.gather(
+        *(_complete_message(message) for message, _ in batch),
+        return_exceptions=True
+    )
+    for (_, future), result in zip(batch, results):
+        if future.cancelled():
+            continue
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+async def _llm_batch_worker():
+    """Drain queued prompts every batch window and dispatch them together"""
+    while True:
+        batch = [await _llm_queue.get()]
+        await asyncio.sleep(LLM_BATCH_WINDOW_MS / 1000)
+        while not _llm_queue.empty():
+            batch.append(_llm_queue.get_nowait())
+        # Dispatch in its own task so draining resumes immediately instead of
+        # holding new arrivals behind this batch's slowest completion
+        fire_and_forget(_dispatch_batch(batch), "LLM batch dispatch")
+
+async def get_ai_response(message: str) -> str:
+    """Queue a prompt for the batch worker and wait for its completion"""
+    future = asyncio.get_running_loop().create_future()
+    await _llm_queue.put((message, future))
+    return await future
+
+@app.on_event("startup")
+async def start_llm_batch_worker():
+    fire_and_forget(_llm_batch_worker(), "LLM batch worker")
+
+@app.on_event("startup")
+async def warm_up_db_pool():
+    """Open the connection pool eagerly instead of on the first request"""
+    await db.command("ping")
+
+@app.on_event("startup")
+async def create_indexes():
+    """Create indexes backing the hot read paths"""
+    await db.chat_messages.create_index([("session_id", 1), ("timestamp", 1)])
+    await db.forum_posts.create_index([("channel", 1), ("timestamp", -1)])
+    await db.forum_posts.create_index([("channel", 1), ("last_activity", -1)])
+    await db.forum_posts.create_index([("id", 1), ("channel", 1)], unique=True)
+    await db.crisis_alerts.create_index([("status", 1), ("timestamp", -1)])
+
 # Helper functions
 def detect_crisis(message: str) -> bool:
     """Detect crisis keywords in message"""
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in CRISIS_KEYWORDS)
+    return _crisis_pattern.search(message) is not None
+
+_USERNAME_PREFIXES = ("Anonymous", "Student", "Mindful", "Helper", "Seeker")
 
 def generate_anonymous_username() -> str:
     """Generate anonymous username"""
-    prefixes = ["Anonymous", "Student", "Mindful", "Helper", "Seeker"]
-    import random
-    return f"{random.choice(prefixes)}_{random.randint(100, 999)}"
+    bits = random.getrandbits(32)
+    prefix = _USERNAME_PREFIXES[bits % len(_USERNAME_PREFIXES)]
+    return f"{prefix}_{100 + (bits >> 3) % 900}"
+
+# Keep strong references to fire-and-forget tasks so they aren't
+# garbage-collected before completing
+_background_tasks = set()
 
-async def log_crisis_alert(session_id: str, message: str):
-    """Log crisis alert to database"""
+def fire_and_forget(coro, description: str):
+    """Run a best-effort coroutine in the background, logging any failure"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    def _done(t):
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logging.error(f"{description} failed: {t.exception()}")
+    task.add_done_callback(_done)
+    return task
+
+# Crisis alerts are buffered and flushed in batches so a burst of alerts
+# costs one insert_many instead of a round-trip each; the flush interval
+# bounds how stale the admin view can be
+ALERT_FLUSH_INTERVAL = 0.25
+ALERT_BUFFER_MAX = 10_000
+_alert_buffer: List[dict] = []
+
+def log_crisis_alert(session_id: str, message: str):
+    """Buffer a crisis alert for the next batch flush"""
     alert = CrisisAlert(session_id=session_id, message=message)
-    await db.crisis_alerts.insert_one(alert.dict())
+    doc = alert.model_dump()
+    # Reuse the alert's own uuid as _id so retrying a flush whose writes may
+    # already have been applied is idempotent
+    doc['_id'] = alert.id
+    _alert_buffer.append(doc)
     logging.warning(f"Crisis alert logged for session {session_id}: {message}")
 
+def _requeue_alerts(batch: List[dict]):
+    """Put a failed batch back so the next flush retries it; alerts must not
+    be dropped just because one insert_many failed"""
+    _alert_buffer[:0] = batch
+    if len(_alert_buffer) > ALERT_BUFFER_MAX:
+        dropped = len(_alert_buffer) - ALERT_BUFFER_MAX
+        del _alert_buffer[:dropped]
+        logging.error(f"Crisis alert buffer overflow, dropped {dropped} oldest alerts")
+
+async def _flush_alerts():
+    """Write any buffered crisis alerts in one insert_many"""
+    if not _alert_buffer:
+        return
+    batch = _alert_buffer.copy()
+    _alert_buffer.clear()
+    try:
+        await db.crisis_alerts.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys mean a previous ambiguous failure already applied
+        # those writes; if that's every error, the batch is fully persisted
+        errors = e.details.get('writeErrors', [])
+        if all(error.get('code') == 11000 for error in errors):
+            return
+        _requeue_alerts(batch)
+        logging.error(f"Crisis alert flush failed, will retry: {str(e)}")
+    except Exception as e:
+        _requeue_alerts(batch)
+        logging.error(f"Crisis alert flush failed, will retry: {str(e)}")
+
+async def _alert_flusher():
+    while True:
+        await asyncio.sleep(ALERT_FLUSH_INTERVAL)
+        await _flush_alerts()
+
+@app.on_event("startup")
+async def start_alert_flusher():
+    fire_and_forget(_alert_flusher(), "Crisis alert flusher")
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -109,42 +298,16 @@ async def root():
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     try:
-        # Initialize OpenRouter client
-        openrouter_key = os.environ.get('OPENROUTER_API_KEY')
-        if not openrouter_key:
-            raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-        
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=openrouter_key,
-            default_headers={"HTTP-Referer": "http://localhost:3000"}
-        )
-        
-        # Mental health system message
-        system_message = """You are a compassionate mental health support assistant for students. 
-        Provide empathetic, supportive responses while maintaining appropriate boundaries. 
-        Encourage professional help when needed. Be warm, understanding, and non-judgmental.
-        Keep responses concise but meaningful."""
-        
         # Check for crisis keywords
         is_crisis = detect_crisis(request.message)
-        
-        # Get AI response using OpenRouter
-        response = client.chat.completions.create(
-            model="openai/gpt-4o",  # You can change this to any model available on OpenRouter
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": request.message}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        ai_response = response.choices[0].message.content
-        
+
+        # Get AI response using OpenRouter via the batch worker
+        ai_response = await get_ai_response(request.message)
+
         # If crisis detected, log alert and modify response
         if is_crisis:
-            await log_crisis_alert(request.session_id, request.message)
+            # Buffered; the flusher writes it out without holding the response
+            log_crisis_alert(request.session_id, request.message)
             crisis_addendum = "\n\n🚨 I'm concerned about you. Please reach out to a counselor or call the crisis helpline: 988 (US) or your local emergency number. You're not alone."
             ai_response = ai_response + crisis_addendum
         
@@ -157,9 +320,10 @@ async def chat_endpoint(request: ChatRequest):
         )
         
         # Prepare for MongoDB
-        chat_dict = chat_msg.dict()
-        chat_dict['timestamp'] = chat_dict['timestamp'].isoformat()
-        await db.chat_messages.insert_one(chat_dict)
+        chat_dict = chat_msg.model_dump()
+        # The response is built from the in-memory message, so the insert can
+        # overlap with serializing and sending the reply
+        fire_and_forget(db.chat_messages.insert_one(chat_dict), "Chat message insert")
         
         return ChatResponse(
             id=chat_msg.id,
@@ -173,47 +337,100 @@ async def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"Chat service error: {str(e)}")
 
 @api_router.get("/chat/history/{session_id}")
-async def get_chat_history(session_id: str):
+async def get_chat_history(
+    session_id: str,
+    before: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
     try:
+        # Keyset pagination: each page is an indexed range scan on
+        # (session_id, timestamp), so cost stays flat as sessions grow.
+        # Clients pass the returned next_before cursor to fetch the
+        # preceding page; null means there is nothing older.
+        query = {"session_id": session_id}
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
+
         messages = await db.chat_messages.find(
-            {"session_id": session_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
-        # Parse timestamps back from ISO string
-        for msg in messages:
-            if isinstance(msg['timestamp'], str):
-                msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
-        
-        return [ChatMessage(**msg) for msg in messages]
+            query, {"_id": 0}
+        ).sort("timestamp", -1).to_list(limit)
+
+        # Documents were validated when written, so return them as-is
+        next_before = messages[-1]['timestamp'] if len(messages) == limit else None
+        return {"messages": messages, "next_before": next_before}
     except Exception as e:
         logging.error(f"Chat history error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
+# Channel of each recently-seen post id, populated on create and read. When a
+# reply targets a known post id under the wrong channel we can 404 without
+# issuing the update; absence from the cache proves nothing, so that case
+# still goes to MongoDB
+_post_channels = cachetools.LRUCache(maxsize=100_000)
+
+_DEFAULT_CHANNELS = ("general", "anxiety", "depression", "study-stress", "relationships")
+
+# Channels change rarely but distinct() scans the collection, so cache the
+# result briefly; create_forum_post invalidates when a new channel appears
+CHANNELS_CACHE_TTL = 60
+_channels_cache = {"value": None, "expires": 0.0}
+
 @api_router.get("/forum/channels")
-async def get_channels():
+async def get_channels(response: Response):
     try:
-        # Get distinct channels
+        # The server-side cache already tolerates 60s staleness, so let
+        # clients cache for the same window
+        response.headers["Cache-Control"] = f"max-age={CHANNELS_CACHE_TTL}"
+        if _channels_cache["value"] is not None and time.monotonic() < _channels_cache["expires"]:
+            return _channels_cache["value"]
+
+        # Get distinct channels, deduplicated against the defaults while
+        # keeping a stable order
         channels = await db.forum_posts.distinct("channel")
-        default_channels = ["general", "anxiety", "depression", "study-stress", "relationships"]
-        all_channels = list(set(channels + default_channels))
-        return {"channels": all_channels}
+        all_channels = list(dict.fromkeys((*_DEFAULT_CHANNELS, *channels)))
+        _channels_cache["value"] = {"channels": all_channels}
+        _channels_cache["expires"] = time.monotonic() + CHANNELS_CACHE_TTL
+        return _channels_cache["value"]
     except Exception as e:
         logging.error(f"Channels error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve channels")
 
 @api_router.get("/forum/{channel}")
-async def get_forum_posts(channel: str):
+async def get_forum_posts(channel: str, request: Request, response: Response):
     try:
+        # Probe only the newest post timestamp and the newest last_activity
+        # (bumped by replies, which never touch the post timestamp) to build
+        # a cheap ETag; on a match the full query and JSON encode are skipped
+        latest_post = await db.forum_posts.find_one(
+            {"channel": channel}, {"_id": 0, "timestamp": 1},
+            sort=[("timestamp", -1)]
+        )
+        latest_activity = await db.forum_posts.find_one(
+            {"channel": channel}, {"_id": 0, "last_activity": 1},
+            sort=[("last_activity", -1)]
+        )
+        etag = '"%s"' % hashlib.blake2b(
+            "{}:{}:{}".format(
+                channel,
+                latest_post['timestamp'] if latest_post else '',
+                (latest_activity or {}).get('last_activity') or ''
+            ).encode(),
+            digest_size=8
+        ).hexdigest()
+
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        response.headers["ETag"] = etag
+
         posts = await db.forum_posts.find(
-            {"channel": channel}
+            {"channel": channel}, {"_id": 0}
         ).sort("timestamp", -1).to_list(100)
-        
-        # Parse timestamps
+
         for post in posts:
-            if isinstance(post['timestamp'], str):
-                post['timestamp'] = datetime.fromisoformat(post['timestamp'])
-        
-        return [ForumPost(**post) for post in posts]
+            _post_channels[post["id"]] = channel
+
+        return _forum_post_list_adapter.validate_python(posts)
     except Exception as e:
         logging.error(f"Forum posts error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve forum posts")
@@ -232,10 +449,16 @@ async def create_forum_post(channel: str, post_data: ForumPostCreate):
         )
         
         # Prepare for MongoDB
-        post_dict = post.dict()
-        post_dict['timestamp'] = post_dict['timestamp'].isoformat()
+        post_dict = post.model_dump()
+        post_dict['last_activity'] = post_dict['timestamp']
         await db.forum_posts.insert_one(post_dict)
-        
+        _post_channels[post.id] = channel
+
+        # A post in a new channel makes the cached channels list stale
+        cached = _channels_cache["value"]
+        if cached is not None and channel not in cached["channels"]:
+            _channels_cache["expires"] = 0.0
+
         return post
     except Exception as e:
         logging.error(f"Create post error: {str(e)}")
@@ -243,6 +466,11 @@ async def create_forum_post(channel: str, post_data: ForumPostCreate):
 
 @api_router.post("/forum/{channel}/{post_id}/reply")
 async def add_reply(channel: str, post_id: str, reply_data: ForumReplyCreate):
+    # A known post id under a different channel can't match; skip the write
+    cached_channel = _post_channels.get(post_id)
+    if cached_channel is not None and cached_channel != channel:
+        raise HTTPException(status_code=404, detail="Post not found")
+
     try:
         # Generate username if not provided
         author = reply_data.author or generate_anonymous_username()
@@ -253,17 +481,22 @@ async def add_reply(channel: str, post_id: str, reply_data: ForumReplyCreate):
         )
         
         # Add reply to post
-        reply_dict = reply.dict()
-        reply_dict['timestamp'] = reply_dict['timestamp'].isoformat()
+        reply_dict = reply.model_dump()
         
+        # Cap the replies array so a single post can't grow without bound and
+        # make every later read of it ship megabytes of replies
         result = await db.forum_posts.update_one(
             {"id": post_id, "channel": channel},
-            {"$push": {"replies": reply_dict}}
+            {
+                "$push": {"replies": {"$each": [reply_dict], "$slice": -1000}},
+                "$currentDate": {"last_activity": True}
+            }
         )
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Post not found")
-            
+
+        _post_channels[post_id] = channel
         return reply
     except Exception as e:
         logging.error(f"Add reply error: {str(e)}")
@@ -273,15 +506,10 @@ async def add_reply(channel: str, post_id: str, reply_data: ForumReplyCreate):
 async def get_crisis_alerts():
     try:
         alerts = await db.crisis_alerts.find(
-            {"status": "open"}
+            {"status": "open"}, {"_id": 0}
         ).sort("timestamp", -1).to_list(100)
-        
-        # Parse timestamps
-        for alert in alerts:
-            if isinstance(alert['timestamp'], str):
-                alert['timestamp'] = datetime.fromisoformat(alert['timestamp'])
-        
-        return [CrisisAlert(**alert) for alert in alerts]
+
+        return _crisis_alert_list_adapter.validate_python(alerts)
     except Exception as e:
         logging.error(f"Crisis alerts error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve crisis alerts")
@@ -306,4 +534,18 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await _flush_alerts()
+    client.close()
+
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop and httptools replace the stdlib event loop and HTTP parser with
+    # C implementations; WEB_CONCURRENCY scales workers to available cores
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1"))
+    )
\ No newline at end of file
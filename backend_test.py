@@ -183,27 +183,68 @@ class MindfulMindTester:
             
             if response.status_code == 200:
                 data = response.json()
-                
-                if not isinstance(data, list):
-                    self.log_result("chat_history", False, f"Expected list, got: {type(data)}")
+
+                if "messages" not in data or "next_before" not in data:
+                    self.log_result("chat_history", False, "Missing 'messages'/'next_before' fields in response")
                     return
-                
+
+                messages = data["messages"]
+                if not isinstance(messages, list):
+                    self.log_result("chat_history", False, f"Expected list of messages, got: {type(messages)}")
+                    return
+
                 # Should have messages from previous tests
-                if len(data) == 0:
+                if len(messages) == 0:
                     self.log_result("chat_history", False, "No chat history found despite previous messages")
                     return
-                
+
                 # Check message structure
-                for msg in data:
+                for msg in messages:
                     required_fields = ["id", "session_id", "message", "response", "is_crisis", "timestamp"]
                     missing_fields = [field for field in required_fields if field not in msg]
-                    
+
                     if missing_fields:
                         self.log_result("chat_history", False, f"Missing fields in history: {missing_fields}")
                         return
-                
-                self.log_result("chat_history", True, f"Retrieved {len(data)} messages correctly")
-                
+
+                # Pages are newest-first for keyset pagination
+                timestamps = [msg["timestamp"] for msg in messages]
+                if timestamps != sorted(timestamps, reverse=True):
+                    self.log_result("chat_history", False, "History page not sorted newest-first")
+                    return
+
+                # Exercise the before/limit cursor: a full limit=1 page must
+                # return a cursor, and following it must not repeat messages
+                paged = requests.get(
+                    f"{BACKEND_URL}/chat/history/{self.session_id}",
+                    params={"limit": 1},
+                    timeout=10
+                )
+                if paged.status_code != 200:
+                    self.log_result("chat_history", False, f"Paged request failed: HTTP {paged.status_code}")
+                    return
+
+                page = paged.json()
+                if len(page.get("messages", [])) != 1 or page.get("next_before") is None:
+                    self.log_result("chat_history", False, "limit=1 page missing message or next_before cursor")
+                    return
+
+                older_response = requests.get(
+                    f"{BACKEND_URL}/chat/history/{self.session_id}",
+                    params={"limit": 1, "before": page["next_before"]},
+                    timeout=10
+                )
+                if older_response.status_code != 200:
+                    self.log_result("chat_history", False, f"Cursor request failed: HTTP {older_response.status_code}")
+                    return
+
+                older = older_response.json()
+                if any(msg["id"] == page["messages"][0]["id"] for msg in older.get("messages", [])):
+                    self.log_result("chat_history", False, "before cursor returned an already-seen message")
+                    return
+
+                self.log_result("chat_history", True, f"Retrieved {len(messages)} messages with working pagination cursor")
+
             else:
                 self.log_result("chat_history", False, f"HTTP {response.status_code}: {response.text}")
                 